@@ -1,14 +1,28 @@
 import streamlit as st
 import numpy as np
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from dataclasses import dataclass
-from typing import List
+from io import BytesIO
+from typing import Iterator, List, Tuple
 import pandas as pd
 import sqlite3
 import os
+import threading
 
-@dataclass
+def _pi(intersections: int, total_needles: int) -> float:
+    """Pi estimate from needle/intersection counts, shared by per-round and cumulative values"""
+    return total_needles / intersections if intersections > 0 else float('inf')
+
+def _pi_array(intersections: np.ndarray, total_needles: np.ndarray, fill: float = np.inf) -> np.ndarray:
+    """Vectorized _pi; entries with no intersections are set to fill"""
+    return np.divide(
+        total_needles, intersections,
+        out=np.full(len(intersections), fill), where=intersections > 0
+    )
+
+@dataclass(frozen=True, slots=True)
 class RoundInfo:
+    """Read-only view of one round, built on demand from the simulation's columns"""
     round_number: int
     intersections: int
     total_needles: int
@@ -17,86 +31,206 @@ class RoundInfo:
     @property
     def round_pi(self) -> float:
         """Calculate pi approximation for this individual round"""
-        return (self.total_needles) / self.intersections if self.intersections > 0 else float('inf')
+        return _pi(self.intersections, self.total_needles)
 
 class BuffonNeedleSimulation:
+    # Shared SQL text so sqlite3's prepared-statement cache is hit on every call
+    _CREATE_SQL = """
+        CREATE TABLE IF NOT EXISTS rounds (
+            round_number INTEGER PRIMARY KEY,
+            intersections INTEGER NOT NULL,
+            total_needles INTEGER NOT NULL,
+            cumulative_pi REAL NOT NULL
+        )
+    """
+    _TOTALS_SQL = "SELECT SUM(intersections), SUM(total_needles), COUNT(*) FROM rounds"
+    _SELECT_SQL = "SELECT round_number, intersections, total_needles, cumulative_pi FROM rounds ORDER BY round_number"
+    _INSERT_SQL = "INSERT INTO rounds (round_number, intersections, total_needles, cumulative_pi) VALUES (?, ?, ?, ?)"
+    _INITIAL_CAPACITY = 1024
+    _ROW_DTYPE = np.dtype([('rn', 'i8'), ('i', 'i8'), ('n', 'i8'), ('p', 'f8')])
+
     def __init__(self, db_path: str = "buffon_needle.db"):
         self.db_path = db_path
+        # In-memory round history as one structured array, filled from SQLite on load
+        self._rows = None
+        self._count = 0
+        # Bumped by clear_data so caches can tell a refilled history from the old one
+        self._generation = 0
+        self._sum_inter = 0
+        self._sum_needles = 0
+        # Guards column state when one instance is shared across Streamlit sessions
+        self._lock = threading.Lock()
+        self._conn = self._connect()
         self.init_database()
-        self.rounds = self.load_rounds()
+        self.load_rounds()
         
+    def _connect(self) -> sqlite3.Connection:
+        """Open the connection held for the lifetime of the simulation"""
+        conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-8000")
+        return conn
+    
+    def _append_row(self, round_number: int, intersections: int, total_needles: int, cumulative_pi: float):
+        i = self._count
+        if i == len(self._rows):
+            # Grow into a new array so views already handed out by columns() stay valid
+            rows = np.empty(max(self._INITIAL_CAPACITY, 2 * i), dtype=self._ROW_DTYPE)
+            rows[:i] = self._rows
+            self._rows = rows
+        self._rows[i] = (round_number, intersections, total_needles, cumulative_pi)
+        self._count += 1
+    
+    def columns(self):
+        """Returns (round_numbers, intersections, total_needles, cumulative_pi) views in chronological order"""
+        return self.history()[1]
+    
+    def history(self):
+        """Returns (generation, columns()) read together, so the generation matches the columns"""
+        with self._lock:
+            rows = self._rows[:self._count]
+            return self._generation, (rows['rn'], rows['i'], rows['n'], rows['p'])
+    
+    def __len__(self) -> int:
+        return self._count
+    
+    def __getitem__(self, index: int) -> RoundInfo:
+        with self._lock:
+            if index < 0:
+                index += self._count
+            if not 0 <= index < self._count:
+                raise IndexError("round index out of range")
+            row = self._rows[index]
+            return RoundInfo(
+                round_number=int(row['rn']),
+                intersections=int(row['i']),
+                total_needles=int(row['n']),
+                cumulative_pi=float(row['p'])
+            )
+    
+    def __iter__(self) -> Iterator[RoundInfo]:
+        return self._round_views(self.columns())
+    
+    @staticmethod
+    def _round_views(columns) -> Iterator[RoundInfo]:
+        # Iterates one columns() snapshot, so a concurrent clear_data cannot shift the indices
+        return (
+            RoundInfo(round_number=int(rn), intersections=int(i), total_needles=int(n), cumulative_pi=float(p))
+            for rn, i, n, p in zip(*columns)
+        )
+    
     def init_database(self):
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS rounds (
-                    round_number INTEGER PRIMARY KEY,
-                    intersections INTEGER NOT NULL,
-                    total_needles INTEGER NOT NULL,
-                    cumulative_pi REAL NOT NULL
-                )
-            """)
+        self._conn.execute(self._CREATE_SQL)
     
     def calculate_cumulative_pi(self, new_intersections: int, new_total_needles: int) -> float:
-        total_intersections = sum(round.intersections for round in self.rounds) + new_intersections
-        total_needles = sum(round.total_needles for round in self.rounds) + new_total_needles
-        return (total_needles) / total_intersections if total_intersections > 0 else float('inf')
-    
-    def load_rounds(self) -> List[RoundInfo]:
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute("SELECT round_number, intersections, total_needles, cumulative_pi FROM rounds ORDER BY round_number")
-            return [
-                RoundInfo(
-                    round_number=row[0],
-                    intersections=row[1],
-                    total_needles=row[2],
-                    cumulative_pi=row[3]
-                )
-                for row in cursor.fetchall()
-            ]
+        total_intersections = self._sum_inter + new_intersections
+        total_needles = self._sum_needles + new_total_needles
+        return _pi(total_intersections, total_needles)
+    
+    def load_rounds(self):
+        sum_inter, sum_needles, count = self._conn.execute(self._TOTALS_SQL).fetchone()
+        self._sum_inter = sum_inter or 0
+        self._sum_needles = sum_needles or 0
+        # Rows stream from the cursor into one structured array; columns() serves field views of it
+        self._rows = np.fromiter(self._conn.execute(self._SELECT_SQL), dtype=self._ROW_DTYPE, count=count)
+        self._count = count
     
     def add_round(self, intersections: int, total_needles: int):
-        cumulative_pi = self.calculate_cumulative_pi(intersections, total_needles)
-        next_round = len(self.rounds) + 1
-        
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("""
-                INSERT INTO rounds (round_number, intersections, total_needles, cumulative_pi)
-                VALUES (?, ?, ?, ?)
-            """, (next_round, intersections, total_needles, cumulative_pi))
-        
-        self.rounds = self.load_rounds()
+        """Persist a new round and append it to the in-memory history without reloading"""
+        with self._lock:
+            cumulative_pi = self.calculate_cumulative_pi(intersections, total_needles)
+            next_round = self._count + 1
+            
+            self._conn.execute(self._INSERT_SQL, (next_round, intersections, total_needles, cumulative_pi))
+            
+            self._sum_inter += intersections
+            self._sum_needles += total_needles
+            self._append_row(next_round, intersections, total_needles, cumulative_pi)
     
-    def get_rounds_for_display(self):
-        """Returns rounds in reverse chronological order"""
-        return list(reversed(self.rounds))
+    def add_rounds(self, rows: List[Tuple[int, int]]):
+        """Persist many (intersections, total_needles) rounds in a single transaction"""
+        if not rows:
+            return
+        with self._lock:
+            intersections, total_needles = (np.asarray(c, dtype=np.int64) for c in zip(*rows))
+            cum_inter = np.cumsum(intersections) + self._sum_inter
+            cum_needles = np.cumsum(total_needles) + self._sum_needles
+            cumulative_pi = _pi_array(cum_inter, cum_needles)
+            first_round = self._count + 1
+            prepared = [
+                (first_round + k, int(i), int(n), float(p))
+                for k, (i, n, p) in enumerate(zip(intersections, total_needles, cumulative_pi))
+            ]
+            
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(self._INSERT_SQL, prepared)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            
+            self._sum_inter = int(cum_inter[-1])
+            self._sum_needles = int(cum_needles[-1])
+            for row in prepared:
+                self._append_row(*row)
+    
+    def get_rounds_for_display(self) -> Iterator[RoundInfo]:
+        """Returns a lazy iterator over rounds in reverse chronological order"""
+        return self._round_views(tuple(c[::-1] for c in self.columns()))
     
     def clear_data(self):
-        if os.path.exists(self.db_path):
-            os.remove(self.db_path)
-        self.init_database()
-        self.rounds = []
+        with self._lock:
+            self._conn.close()
+            self._rows = None
+            self._count = 0
+            for path in (self.db_path, self.db_path + "-wal", self.db_path + "-shm"):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._conn = self._connect()
+            self.init_database()
+            self.load_rounds()
+            self._generation += 1
 
-def plot_pi_approximation(rounds: List[RoundInfo], figsize=(10, 6)):
-    if not rounds:
-        return plt.Figure()
-    
-    fig, ax = plt.subplots(figsize=figsize)
+def plot_pi_approximation(simulation: BuffonNeedleSimulation, figsize=(10, 6)) -> bytes:
+    """Returns the pi approximation plot as PNG bytes, re-rendering only when the rounds change"""
+    generation, columns = simulation.history()
+    return _cached_pi_png(*_history_key(generation, columns), figsize, columns)
+
+def _history_key(generation: int, columns):
+    """Cheap (generation, round count, latest cumulative pi) key identifying a history() snapshot"""
+    cumulative_pi = columns[3]
+    return generation, len(cumulative_pi), float(cumulative_pi[-1]) if len(cumulative_pi) else 0.0
+
+@st.cache_data(max_entries=1)
+def _cached_pi_png(generation: int, round_count: int, last_pi: float, figsize, _columns) -> bytes:
+    # generation, round_count and last_pi form the cache key; the column arrays themselves are not hashed
+    fig = _render_pi_approximation(_columns, figsize)
+    buffer = BytesIO()
+    fig.savefig(buffer, format="png", dpi=200, bbox_inches="tight")
+    return buffer.getvalue()
+
+def _render_pi_approximation(columns, figsize=(10, 6)) -> Figure:
+    # A bare Figure is not tracked by pyplot, so it is freed once the PNG is rendered
+    round_numbers, _, _, cumulative_pi_estimates = columns
+    fig = Figure(figsize=figsize)
+    if len(round_numbers) == 0:
+        return fig
     
-    round_numbers = [r.round_number for r in rounds]
-    cumulative_pi_estimates = [r.cumulative_pi for r in rounds]
-    individual_pi_estimates = [(r.total_needles / r.intersections) if r.intersections > 0 else np.nan for r in rounds]
+    ax = fig.subplots()
     
     ax.plot(round_numbers, cumulative_pi_estimates, 'b-', label='Pi Approximation')
     ax.axhline(y=np.pi, color='r', linestyle='--', label=f'π ≈ {np.pi:.3f}')
     # Add pi reference line with annotation
-    min_val = min(cumulative_pi_estimates)
-    max_val = max(cumulative_pi_estimates)
-    data_range = max_val - min_val
+    min_val = cumulative_pi_estimates.min()
+    data_range = np.ptp(cumulative_pi_estimates)
 
         # Add a small padding to the data range
     padding = data_range * 0.1 if data_range > 0 else 0.1
     y_min = min_val - padding
-    y_max = max_val + padding
+    y_max = min_val + data_range + padding
 
         # Set y-limits based on data, without forcing π to be included
     ax.set_ylim([y_min, y_max])
@@ -120,47 +254,61 @@ def plot_pi_approximation(rounds: List[RoundInfo], figsize=(10, 6)):
     ax.legend()
     ax.grid(True)
     
-    min_val = min(cumulative_pi_estimates)
-    max_val = max(cumulative_pi_estimates)
-    padding = (max_val - min_val) * 0.1
-    ax.set_ylim([min_val - padding, max_val + padding])
-    
     return fig
 
+# Float columns are formatted client-side so they stay numeric (and sortable) in the table
+_HISTORY_COLUMN_CONFIG = {
+    "Round π": st.column_config.NumberColumn(format="%.6f"),
+    "Cumulative π": st.column_config.NumberColumn(format="%.6f"),
+    "Difference from π": st.column_config.NumberColumn(format="%.6f")
+}
+
+def build_rounds_dataframe(columns) -> pd.DataFrame:
+    """Build the rounds history table, newest round first, from a columns() snapshot"""
+    round_numbers, intersections, total_needles, cumulative_pi = (c[::-1] for c in columns)
+    round_pi = _pi_array(intersections, total_needles)
+    return pd.DataFrame({
+        "Round": round_numbers,
+        "Intersections": intersections,
+        "Total Sticks": total_needles,
+        "Round π": round_pi,
+        "Cumulative π": cumulative_pi,
+        "Difference from π": np.abs(cumulative_pi - np.pi)
+    })
+
+@st.dialog("Confirm clear")
+def confirm_clear(simulation: BuffonNeedleSimulation):
+    # Widgets inside the dialog rerun only the dialog; the page reruns once on confirm or cancel
+    st.warning("Are you sure you want to clear all data?")
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("Yes, Clear Data", type="primary", key="confirm_clear"):
+            simulation.clear_data()
+            _cached_pi_png.clear()
+            st.rerun()
+    with col2:
+        if st.button("Cancel", key="cancel_clear"):
+            st.rerun()
+
+@st.cache_resource
+def get_simulation() -> BuffonNeedleSimulation:
+    """Returns the process-wide simulation shared by all sessions"""
+    return BuffonNeedleSimulation()
+
 def main():
     st.set_page_config(layout="wide")
     st.title("Buffon's Needle Pi Estimation")
     
-    if 'simulation' not in st.session_state:
-        st.session_state.simulation = BuffonNeedleSimulation()
+    simulation = get_simulation()
     
     col1, col2 = st.columns([0.7, 0.3])
     
     with col1:
-        fig = plot_pi_approximation(st.session_state.simulation.rounds)
-        st.pyplot(fig)
-        
-        # Initialize dialog state if not exists
-        if 'show_clear_dialog' not in st.session_state:
-            st.session_state.show_clear_dialog = False
+        st.image(plot_pi_approximation(simulation))
         
-        # Show clear data button
+        # Show clear data button; confirmation happens in a modal dialog
         if st.button("Clear All Data", key="clear_btn"):
-            st.session_state.show_clear_dialog = True
-        
-        # Show confirmation dialog
-        if st.session_state.show_clear_dialog:
-            st.warning("Are you sure you want to clear all data?")
-            col1, col2 = st.columns(2)
-            with col1:
-                if st.button("Yes, Clear Data", type="primary", key="confirm_clear"):
-                    st.session_state.simulation.clear_data()
-                    st.session_state.show_clear_dialog = False
-                    st.rerun()
-            with col2:
-                if st.button("Cancel", key="cancel_clear"):
-                    st.session_state.show_clear_dialog = False
-                    st.rerun()
+            confirm_clear(simulation)
     
     with col2:
         st.subheader("Add New Round")
@@ -182,32 +330,27 @@ def main():
             submitted = st.form_submit_button("Next Round")
             
             if submitted and intersections > 0:
-                st.session_state.simulation.add_round(intersections, total_needles)
+                simulation.add_round(intersections, total_needles)
                 st.rerun()
         
         # Display rounds in reverse chronological order
         st.subheader("Rounds History")
-        all_rounds = st.session_state.simulation.get_rounds_for_display()
-        
-        if all_rounds:
-            df = pd.DataFrame([
-                {
-                    "Round": r.round_number,
-                    "Intersections": r.intersections,
-                    "Total Sticks": r.total_needles,
-                    "Round π": f"{r.round_pi:.6f}",
-                    "Cumulative π": f"{r.cumulative_pi:.6f}",
-                    "Difference from π": f"{abs(r.cumulative_pi - np.pi):.6f}"
-                }
-                for r in all_rounds
-            ])
+        generation, columns = simulation.history()
+        if len(columns[0]):
+            # Rebuild the table only when the round history has changed since the last rerun
+            history_key = _history_key(generation, columns)
+            if st.session_state.get("_df_key") != history_key:
+                st.session_state._df = build_rounds_dataframe(columns)
+                st.session_state._df_key = history_key
+            df = st.session_state._df
             
             # Create a container with fixed height and scrolling
             with st.container():
                 st.dataframe(
                     df,
                     height=300,  # Fixed height with scrolling
-                    hide_index=True
+                    hide_index=True,
+                    column_config=_HISTORY_COLUMN_CONFIG
                 )
 
 if __name__ == "__main__":